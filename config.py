@@ -15,3 +15,13 @@ class Config:
     # LLM config
     LLM = "anthropic/claude-3-5-sonnet-20240620"
     # LLM = "groq/llama-3.1-70b-versatile"
+    # Prompt token budget; the oldest turns are dropped beyond it
+    LLM_PROMPT_BUDGET_TOKENS = 100_000
+
+    # LLM response cache
+    LLM_CACHE_ENABLED = True
+    LLM_CACHE_DIR = ".cache/llm"
+    # Near-duplicate matching is off by default: prompts carry the live state,
+    # so a loose match can replay a reply meant for a different moment
+    LLM_SEMANTIC_CACHE = False
+    LLM_SEMANTIC_CACHE_THRESHOLD = 0.87
@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain_core.embeddings import Embeddings
+from openai import OpenAI, AsyncOpenAI
+
+class FastEmbeddings(Embeddings):
+    """
+    OpenAI embeddings called directly through the openai client.
+    Texts are split into batches that are sent concurrently, instead of one after another.
+    Implements the langchain Embeddings interface, so it can be used as a Chroma embedding function.
+    """
+    def __init__(
+        self,
+        model: str = "text-embedding-3-small",
+        batch_size: int = 256,
+        max_concurrency: int = 8,
+        max_retries: int = 6
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.client = OpenAI(max_retries=max_retries)
+        self.async_client = AsyncOpenAI(max_retries=max_retries)
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        """Split texts into request-sized batches"""
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed a single batch"""
+        response = self.client.embeddings.create(input=batch, model=self.model)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    async def _aembed_batch(self, batch: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """Async version of _embed_batch"""
+        async with semaphore:
+            response = await self.async_client.embeddings.create(input=batch, model=self.model)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, running batches in parallel threads"""
+        batches = self._batches(texts)
+        if not batches:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            results = list(pool.map(self._embed_batch, batches))
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        return self._embed_batch([text])[0]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, gathering all batches concurrently"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(
+            *(self._aembed_batch(batch, semaphore) for batch in self._batches(texts))
+        )
+        return [vector for batch in results for vector in batch]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.aembed(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed([text]))[0]
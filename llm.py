@@ -1,28 +1,143 @@
+import asyncio
 import litellm
 from litellm import completion as litellm_completion
+from litellm import acompletion as litellm_acompletion
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
 from config import Config
+from llm_cache import ResponseCache
+from prompt_compressor import compress
 import json
-from typing import Optional, Dict, Any, List
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Callable
+
+# litellm's Anthropic handler opens a new connection for every non-streaming sync call
+# unless it's given a client; async calls already reuse its cached, pooled clients
+anthropic_http_client = HTTPHandler()
+
+def http_client(model: str) -> Optional[HTTPHandler]:
+    """Shared keep-alive client for sync calls to providers that accept one"""
+    return anthropic_http_client if model.startswith("anthropic/") else None
+
+response_cache = ResponseCache(
+    Config.LLM_CACHE_DIR,
+    semantic=Config.LLM_SEMANTIC_CACHE,
+    threshold=Config.LLM_SEMANTIC_CACHE_THRESHOLD
+) if Config.LLM_CACHE_ENABLED else None
+
+@lru_cache(maxsize=None)
+def supports_function_calling(model: str) -> bool:
+    """Whether the model supports tools, looked up once per model"""
+    return litellm.supports_function_calling(model)
+
+PROMPT_CACHING_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+def supports_prompt_caching(model: str) -> bool:
+    """Whether the provider can cache static prompt prefixes marked with cache_control"""
+    return model.startswith("anthropic/")
+
+def system_message(content: str, model: str = Config.LLM) -> Dict[str, Any]:
+    """
+    Build a system message.
+    For providers with prompt caching, the content is marked as a cache breakpoint,
+    so the static prefix (tool schemas + system prompt) is reused across calls.
+    """
+    if not supports_prompt_caching(model):
+        return {"role": "system", "content": content}
+    return {
+        "role": "system",
+        "content": [
+            {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+        ]
+    }
 
 def completion(
     messages: list,
     model: str = Config.LLM,
     tools: Optional[List[Dict[str, Any]]] = None,
-    tool_choice: str = "auto"
+    tool_choice: str = "auto",
+    stream: bool = False,
+    on_chunk: Optional[Callable[[Any], None]] = None
 ) -> str:
     """
     Make a completion call to the LLM.
     If tools are provided, the model may choose to call them.
+    Messages are compressed to the prompt token budget first, and responses
+    are served from the response cache when possible.
+    With stream=True, on_chunk is called with every chunk as it arrives, and the
+    assembled response is returned at the end (cached responses are not streamed).
     """
-    if tools and not litellm.supports_function_calling(model):
+    if tools and not supports_function_calling(model):
         raise ValueError(f"Model {model} does not support function calling")
 
+    messages = compress(messages, model, Config.LLM_PROMPT_BUDGET_TOKENS)
+
+    if response_cache:
+        cached = response_cache.get(messages, model, tools, tool_choice)
+        if cached is not None:
+            return cached
+
     response = litellm_completion(
         messages=messages,
         model=model,
         tools=tools,
-        tool_choice=tool_choice
+        tool_choice=tool_choice,
+        extra_headers=PROMPT_CACHING_HEADERS if supports_prompt_caching(model) else None,
+        stream=stream,
+        client=http_client(model)
+    )
+    if stream:
+        chunks = []
+        for chunk in response:
+            chunks.append(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+        response = litellm.stream_chunk_builder(chunks, messages=messages)
+
+    if response_cache:
+        response_cache.set(messages, model, response, tools, tool_choice)
+    
+    return response
+
+async def acompletion(
+    messages: list,
+    model: str = Config.LLM,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    tool_choice: str = "auto",
+    stream: bool = False,
+    on_chunk: Optional[Callable[[Any], None]] = None
+) -> str:
+    """
+    Async version of completion.
+    Lets independent LLM calls run concurrently (e.g. with asyncio.gather).
+    """
+    if tools and not supports_function_calling(model):
+        raise ValueError(f"Model {model} does not support function calling")
+
+    messages = compress(messages, model, Config.LLM_PROMPT_BUDGET_TOKENS)
+
+    if response_cache:
+        cached = await asyncio.to_thread(response_cache.get, messages, model, tools, tool_choice)
+        if cached is not None:
+            return cached
+
+    response = await litellm_acompletion(
+        messages=messages,
+        model=model,
+        tools=tools,
+        tool_choice=tool_choice,
+        extra_headers=PROMPT_CACHING_HEADERS if supports_prompt_caching(model) else None,
+        stream=stream
     )
+    if stream:
+        chunks = []
+        async for chunk in response:
+            chunks.append(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+        response = litellm.stream_chunk_builder(chunks, messages=messages)
+
+    if response_cache:
+        await asyncio.to_thread(response_cache.set, messages, model, response, tools, tool_choice)
     
     return response
 
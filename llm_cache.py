@@ -0,0 +1,96 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+import litellm
+from diskcache import Cache
+from langchain_chroma import Chroma
+from embeddings import FastEmbeddings
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses.
+    Exact matches are looked up on disk by a hash of the full request; on a miss,
+    the optional semantic tier looks for a near-duplicate request by embedding similarity.
+    """
+    def __init__(self, cache_dir: Path, semantic: bool = False, threshold: float = 0.87):
+        self.cache_dir = Path(cache_dir)
+        self.threshold = threshold
+        self.exact = Cache(str(self.cache_dir / "exact"))
+        self.semantic_store = self._initialize_semantic_store() if semantic else None
+
+    def _initialize_semantic_store(self) -> Chroma:
+        """Initialize the vector store holding embedded requests"""
+        return Chroma(
+            collection_name="llm_response_cache",
+            embedding_function=FastEmbeddings(),
+            persist_directory=str(self.cache_dir / "semantic"),
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+
+    def _scope(self, model: str, tools: Optional[List[Dict[str, Any]]], tool_choice: str) -> str:
+        """Hash of everything besides the messages that affects the response"""
+        tools_json = json.dumps(tools or [], sort_keys=True)
+        return hashlib.sha256(f"{model}\n{tool_choice}\n{tools_json}".encode()).hexdigest()
+
+    def _key(self, messages: list, scope: str) -> str:
+        """Exact cache key for a request"""
+        messages_json = json.dumps(messages, sort_keys=True)
+        return hashlib.sha256(f"{messages_json}\n{scope}".encode()).hexdigest()
+
+    def _semantic_text(self, messages: list) -> str:
+        """Concatenate system and user content for embedding"""
+        parts = []
+        for message in messages:
+            if message["role"] not in ("system", "user"):
+                continue
+            content = message["content"]
+            if isinstance(content, list):
+                # Content blocks, e.g. [{"type": "text", "text": ...}]
+                content = "\n".join(block.get("text", "") for block in content)
+            parts.append(content)
+        return "\n".join(parts)
+
+    def get(
+        self,
+        messages: list,
+        model: str,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: str = "auto"
+    ) -> Optional[litellm.ModelResponse]:
+        """Return a cached response for this request, if any"""
+        scope = self._scope(model, tools, tool_choice)
+        cached = self.exact.get(self._key(messages, scope))
+
+        if cached is None and self.semantic_store is not None:
+            results = self.semantic_store.similarity_search_with_relevance_scores(
+                query=self._semantic_text(messages),
+                k=1,
+                filter={"scope": scope}
+            )
+            if results and results[0][1] >= self.threshold:
+                cached = self.exact.get(results[0][0].metadata["key"])
+
+        if cached is None:
+            return None
+        return litellm.ModelResponse(**cached)
+
+    def set(
+        self,
+        messages: list,
+        model: str,
+        response: litellm.ModelResponse,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: str = "auto"
+    ):
+        """Store a response in both tiers"""
+        scope = self._scope(model, tools, tool_choice)
+        key = self._key(messages, scope)
+        self.exact.set(key, response.model_dump())
+
+        if self.semantic_store is not None:
+            self.semantic_store.add_texts(
+                texts=[self._semantic_text(messages)],
+                metadatas=[{"key": key, "scope": scope}],
+                ids=[key]
+            )
@@ -1,20 +1,26 @@
 import os
+import re
+import asyncio
+import threading
 import warnings
 from dotenv import load_dotenv
 from loguru import logger
 from datetime import datetime
 import json
+from functools import lru_cache
 from config import Config
-from llm import completion, execute_tool_calls
-from schema import Action, Reflection, MemoryEntry
+from llm import completion, acompletion, execute_tool_calls, system_message
+from schema import Action, Reflection, MemoryEntry, Identity, Conversation, MESSAGE_ADAPTER, MEMORY_ADAPTER
 from mido import MiDO
+from prompt_compressor import drop_to_budget
 from prompts import (
     ACTION_SYSTEM_PROMPT,
-    ACTION_USER_PROMPT,
     REFLECTION_SYSTEM_PROMPT,
-    REFLECTION_USER_PROMPT,
+    render_action,
+    render_reflection,
 )
-from typing import Optional
+from typing import Optional, List, Dict, Tuple
+from pydantic import TypeAdapter
 
 # Suppress Pydantic warning about fields config
 warnings.filterwarnings('ignore', message='Valid config keys have changed in V2')
@@ -118,39 +124,114 @@ REFLECTION_TOOLS = [
     }
 ]
 
+# Bookkeeping fields that don't help the model decide what to do
+PROMPT_MEMORY_EXCLUDE = {"embedding", "last_accessed", "access_count", "consolidated"}
+
+# Latest messages always sent; the conversation is how the user's last message reaches the action prompt
+PROMPT_KEEP_MESSAGES = 2
+# Messages this close to the end are only left out after every memory
+PROMPT_RECENT_MESSAGES = 6
+
+# Serializes a memory list to JSON in a single pydantic-core pass
+MEMORIES_ADAPTER = TypeAdapter(List[MemoryEntry])
+
 AVAILABLE_FUNCTIONS = {
     "speak": speak,
     "reflect": reflect
 }
 
-def get_action(mido: MiDO, user_input: str) -> Action:
-    """Get next action from LLM based on current state and intention"""
-    messages = [
+@lru_cache(maxsize=None)
+def _action_system_message(identity: Identity) -> Dict:
+    """System message for action calls, built once per identity"""
+    return system_message(
+        ACTION_SYSTEM_PROMPT.format(
+            name=identity.name,
+            goal=identity.goal,
+            personality=identity.personality
+        )
+    )
+
+@lru_cache(maxsize=None)
+def _reflection_system_message(identity: Identity) -> Dict:
+    """System message for reflection calls, built once per identity"""
+    return system_message(
+        REFLECTION_SYSTEM_PROMPT.format(
+            name=identity.name
+        )
+    )
+
+def _fit_context(mido: MiDO, memories: List[MemoryEntry], required: List[str]) -> Tuple[str, str]:
+    """
+    Memories and conversation as JSON. Over the token budget, leaves out the
+    oldest messages, then the least relevant memories, then the newer messages,
+    always keeping the latest turn
+    """
+    conversation = mido.current_conversation
+    messages = conversation.messages
+    keep_start = max(len(messages) - PROMPT_KEEP_MESSAGES, 0)
+    recent_start = max(len(messages) - PROMPT_RECENT_MESSAGES, 0)
+    texts = [MESSAGE_ADAPTER.dump_json(m).decode() for m in messages]
+    memory_texts = [
+        MEMORY_ADAPTER.dump_json(m, exclude=PROMPT_MEMORY_EXCLUDE).decode()
+        for m in reversed(memories)
+    ]
+    dropped = drop_to_budget(
+        required + texts[keep_start:],
+        texts[:recent_start] + memory_texts + texts[recent_start:keep_start],
+        Config.LLM,
+        Config.LLM_PROMPT_BUDGET_TOKENS
+    )
+    if dropped:
+        old_dropped = min(dropped, recent_start)
+        memories_dropped = min(dropped - old_dropped, len(memories))
+        recent_dropped = dropped - old_dropped - memories_dropped
+        messages = messages[old_dropped:recent_start] + messages[recent_start + recent_dropped:]
+        memories = memories[:len(memories) - memories_dropped]
+        conversation = Conversation.model_construct(messages=messages, summary=conversation.summary)
+    return (
+        MEMORIES_ADAPTER.dump_json(memories, exclude={"__all__": PROMPT_MEMORY_EXCLUDE}).decode(),
+        conversation.model_dump_json()
+    )
+
+def _action_messages(mido: MiDO, memories: List[MemoryEntry], user_input: str) -> List[Dict]:
+    """Build the messages for an action call"""
+    state = mido.current_state.model_dump_json()
+    memories_json, conversation = _fit_context(mido, memories, [ACTION_SYSTEM_PROMPT, state, user_input])
+    # Static content first, so the provider can cache it as a prefix
+    return [
+        _action_system_message(mido.identity),
         {
-            "role": "system",
-            "content": ACTION_SYSTEM_PROMPT.format(
-                name=mido.identity.name,
-                goal=mido.identity.goal,
-                personality=mido.identity.personality
+            "role": "user",
+            "content": render_action(
+                state=state,
+                memories=memories_json,
+                conversation=conversation,
+                user_input=user_input
             )
-        },
+        }
+    ]
+
+def _reflection_messages(mido: MiDO, action: Action, user_input: str) -> List[Dict]:
+    """Build the messages for a reflection call"""
+    state = mido.current_state.model_dump_json()
+    action_json = action.model_dump_json()
+    _, conversation = _fit_context(mido, [], [REFLECTION_SYSTEM_PROMPT, state, action_json, user_input])
+    # Static content first, so the provider can cache it as a prefix
+    return [
+        _reflection_system_message(mido.identity),
         {
             "role": "user",
-            "content": ACTION_USER_PROMPT.format(
-                state=mido.current_state.model_dump_json(),
-                memories=[m.model_dump() for m in mido.get_relevant_memories(user_input)],
-                conversation=mido.current_conversation.model_dump_json(),
+            "content": render_reflection(
+                state=state,
+                action=action_json,
+                conversation=conversation,
                 user_input=user_input
             )
         }
     ]
-    
-    response = completion(
-        messages=messages,
-        tools=AVAILABLE_TOOLS,
-        tool_choice="auto"
-    )
-    
+
+def _tool_result(response, messages: List[Dict]) -> dict:
+    """Execute the tool calls of a response and return the first result"""
     tool_calls = response.choices[0].message.tool_calls
     if not tool_calls:
         raise ValueError("Model did not make any tool calls")
@@ -159,72 +240,183 @@ def get_action(mido: MiDO, user_input: str) -> Action:
     messages = execute_tool_calls(tool_calls, AVAILABLE_FUNCTIONS, messages)
     
     # Get the first tool call result (for now we only support one action at a time)
-    tool_result = json.loads(messages[-1]["content"])
-    return Action(**tool_result)
+    return json.loads(messages[-1]["content"])
+
+_SPEAK_CONTENT_START = re.compile(r'"content"\s*:\s*"')
+
+def _partial_speak_content(arguments: str) -> Optional[str]:
+    """Decode as much of the content argument as has arrived in a streamed speak call"""
+    match = _SPEAK_CONTENT_START.search(arguments)
+    if not match:
+        return None
+    raw = arguments[match.end():]
+    
+    # Stop at the closing quote, or before an escape sequence that isn't complete yet
+    end = 0
+    while end < len(raw) and raw[end] != '"':
+        if raw[end] == "\\":
+            step = 6 if raw[end + 1:end + 2] == "u" else 2
+            if end + step > len(raw):
+                break
+            end += step
+        else:
+            end += 1
+    
+    text = json.loads(f'"{raw[:end]}"')
+    # Hold back the first half of a surrogate pair until the second one arrives
+    if text and "\ud800" <= text[-1] <= "\udbff":
+        text = text[:-1]
+    return text
+
+class SpeechStream:
+    """Prints what the MiDO says while the speak call is still streaming in"""
+    def __init__(self, name: str):
+        self.name = name
+        self.tool_name = None
+        self.arguments = ""
+        self.printed = 0
+    
+    def __call__(self, chunk):
+        if not chunk.choices:
+            return
+        # Only the first tool call is used as the action
+        for tool_call in chunk.choices[0].delta.tool_calls or []:
+            if tool_call.index != 0 or not tool_call.function:
+                continue
+            self.tool_name = tool_call.function.name or self.tool_name
+            self.arguments += tool_call.function.arguments or ""
+        
+        if self.tool_name != "speak":
+            return
+        text = _partial_speak_content(self.arguments)
+        if text is not None and len(text) > self.printed:
+            self._print(text[self.printed:])
+            self.printed = len(text)
+    
+    def _print(self, text: str):
+        if not self.printed:
+            print(f"\n{self.name}: ", end="")
+        print(text, end="", flush=True)
+    
+    def finish(self, action: Action):
+        """Print whatever wasn't streamed (e.g. a cached response) and end the line"""
+        if action.type != "speak":
+            return
+        if len(action.content) > self.printed:
+            self._print(action.content[self.printed:])
+        print("\n")
+
+def get_action(mido: MiDO, user_input: str, stream: bool = False) -> Action:
+    """
+    Get next action from LLM based on current state and intention.
+    With stream=True, speech is printed as it is generated.
+    """
+    memories = mido.get_relevant_memories(user_input)
+    messages = _action_messages(mido, memories, user_input)
+    speech = SpeechStream(mido.identity.name) if stream else None
+    
+    response = completion(
+        messages=messages,
+        tools=AVAILABLE_TOOLS,
+        tool_choice="auto",
+        stream=stream,
+        on_chunk=speech
+    )
+    action = Action(**_tool_result(response, messages))
+    if speech:
+        speech.finish(action)
+    return action
+
+async def get_action_async(mido: MiDO, user_input: str, stream: bool = False) -> Action:
+    """Async version of get_action"""
+    memories = await mido.aget_relevant_memories(user_input)
+    messages = _action_messages(mido, memories, user_input)
+    speech = SpeechStream(mido.identity.name) if stream else None
+    
+    response = await acompletion(
+        messages=messages,
+        tools=AVAILABLE_TOOLS,
+        tool_choice="auto",
+        stream=stream,
+        on_chunk=speech
+    )
+    action = Action(**_tool_result(response, messages))
+    if speech:
+        speech.finish(action)
+    return action
 
 def get_reflection(mido: MiDO, action: Action, user_input: str) -> Reflection:
     """Get reflection from LLM based on current state, action taken, and input"""
-    messages = [
-        {
-            "role": "system",
-            "content": REFLECTION_SYSTEM_PROMPT.format(
-                name=mido.identity.name
-            )
-        },
-        {
-            "role": "user",
-            "content": REFLECTION_USER_PROMPT.format(
-                state=mido.current_state.model_dump_json(),
-                action=action.model_dump_json(),
-                conversation=mido.current_conversation.model_dump_json(),
-                user_input=user_input
-            )
-        }
-    ]
+    messages = _reflection_messages(mido, action, user_input)
     
     response = completion(
         messages=messages,
         tools=REFLECTION_TOOLS,
         tool_choice="auto"
     )
+    return Reflection(**_tool_result(response, messages))
+
+async def get_reflection_async(mido: MiDO, action: Action, user_input: str) -> Reflection:
+    """Async version of get_reflection"""
+    messages = _reflection_messages(mido, action, user_input)
     
-    tool_calls = response.choices[0].message.tool_calls
-    if not tool_calls:
-        raise ValueError("Model did not make any tool calls")
-    
-    # Execute the tool calls
-    messages = execute_tool_calls(tool_calls, AVAILABLE_FUNCTIONS, messages)
-    
-    # Get the reflection result
-    reflection_result = json.loads(messages[-1]["content"])
-    return Reflection(**reflection_result)
+    response = await acompletion(
+        messages=messages,
+        tools=REFLECTION_TOOLS,
+        tool_choice="auto"
+    )
+    return Reflection(**_tool_result(response, messages))
 
-def main():
+async def ainput(prompt: str) -> str:
+    """Read a line from the console without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(setter, value):
+        if not future.done():
+            setter(value)
+
+    def read():
+        # Daemon thread so a pending read never holds up shutdown
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(resolve, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(resolve, future.set_result, line)
+
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+async def main():
     logger.info('Initializing MiDO...')
     mido = MiDO("InterChild")
     logger.info(f'MiDO {mido.identity.name} initialized with goal: {mido.identity.goal}')
 
+    # Consolidate memories in the background instead of on the interactive path
+    consolidation_task = asyncio.create_task(mido.memory_system.consolidation_loop())
+
     try:
+        # Execute action based on current state/intention
+        # Speech is printed while it streams in
+        action = await get_action_async(mido, "", stream=True)
         while True:
-            # Execute action based on current state/intention
-            action = get_action(mido, "")
             logger.info(f'Action: {action.model_dump_json()}')
-            if action.type == "speak":
-                print(f"\n{mido.identity.name}: {action.content}\n")
             mido.add_message("assistant", action.content)
             
             # Get user input
-            user_input = input(f"{mido.identity.name}> ")
+            user_input = await ainput(f"{mido.identity.name}> ")
             if user_input.lower() in ['exit', 'quit', 'bye']:
-                # Save final conversation before exiting
-                mido.save_all()
                 break
             
             # Record user message
             mido.add_message("user", user_input)
             
-            # Reflect and form new intention
-            reflection = get_reflection(mido, action, user_input)
+            # Reflect on this turn while the next action is being generated.
+            # Both only depend on the state and conversation as of now.
+            reflection_task = asyncio.create_task(get_reflection_async(mido, action, user_input))
+            next_action_task = asyncio.create_task(get_action_async(mido, "", stream=True))
+            reflection, action = await asyncio.gather(reflection_task, next_action_task)
             logger.info(f'Reflection: {reflection.model_dump_json()}')
             
             # Save state and memory updates
@@ -233,14 +425,28 @@ def main():
                 mido.memory_system.add_memory(reflection.memory_formation)
             
             # Save conversation periodically (every 10 messages)
-            if len(mido.current_conversation.messages) >= 10:
+            if mido.conversation_length >= 10:
                 mido.save_conversation()
     
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("Gracefully shutting down...")
+    
+    finally:
+        # Save final conversation before exiting; save_all runs the last consolidation itself
+        consolidation_task.cancel()
+        try:
+            await consolidation_task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Still save below if background consolidation failed
+            logger.exception("Background consolidation failed")
         mido.save_all()
     
     logger.info("Goodbye!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
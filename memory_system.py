@@ -1,201 +1,438 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
+from functools import cached_property, wraps
+import asyncio
+import atexit
+import hashlib
+import mmap
 import json
+import os
+import threading
+import numpy as np
+import orjson
 from pathlib import Path
+from loguru import logger
 from langchain_community.document_loaders import JSONLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
-from schema import MemoryEntry, MemoryType, MemoryCategory
+from openai import AsyncOpenAI, OpenAIError
+from embeddings import FastEmbeddings
+from vector_index import QuantizedIndex, grow_buffers, top_k
+from schema import MemoryEntry, MemoryEmbedding, MemoryMetadata, MemoryType, MemoryCategory, MEMORY_ADAPTER, METADATA_ADAPTER
+
+def _locked(method):
+    """Run the method holding the memory system's lock"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class MemorySystem:
-    def __init__(self, mido_dir: Path, settings: Dict):
+    # Number of queued chunks that triggers a vector store write
+    INDEX_BATCH_SIZE = 32
+    # Number of recent memories new ones are checked against for duplicates
+    DEDUP_WINDOW = 256
+    # Memory fields kept as columns for vectorized filtering
+    COLUMN_DTYPES = {
+        "timestamp": "datetime64[us]",
+        "importance": np.int64,
+        "access_count": np.int64,
+        "consolidated": bool
+    }
+
+    def __init__(self, mido_dir: Path, settings: Dict, use_mmap: bool = False):
         self.mido_dir = mido_dir
         self.settings = settings
+        self.use_mmap = use_mmap
         self.memory_path = mido_dir / "memory.jsonl"
         self.vector_store_path = mido_dir / "vector_store"
         
-        # Initialize embeddings and text splitter
-        self.embeddings = OpenAIEmbeddings()
+        # Memories can be written from a background thread
+        self._lock = threading.RLock()
+        
+        # Initialize text splitter; embeddings and vector store are created on first use
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             add_start_index=True
         )
         
-        # Load memories and initialize vector store
+        # Load memories
         self.memories = self._load_memories()
-        self.vector_store = self._initialize_vector_store()
+        self._by_timestamp = {m.timestamp: m for m in self.memories}
+        self._build_columns()
+        
+        # Content fingerprints of recent memories, mapped to their timestamps
+        self._recent_fingerprints: OrderedDict[bytes, str] = OrderedDict()
+        for memory in self.memories[-self.DEDUP_WINDOW:]:
+            self._remember_fingerprint(memory)
+        
+        # Chunks waiting to be embedded and added to the vector store
+        self._pending_texts: List[str] = []
+        self._pending_metadatas: List[Dict] = []
+        
+        # Keep the JSONL open for appends instead of reopening per memory
+        self._memory_fh = open(self.memory_path, "ab", buffering=1 << 16)
+        # Stored memories not written yet, held until their embeddings are in
+        self._unwritten: deque = deque()
+        atexit.register(self.close)
         
         # Schedule periodic consolidation
         self.last_consolidation = datetime.now()
+        # Held for a whole consolidation, by the background loop and by save_all
+        self._consolidation_lock = threading.Lock()
+    
+    @cached_property
+    def embeddings(self) -> FastEmbeddings:
+        """Embeddings client, created on first use"""
+        return FastEmbeddings()
+    
+    @cached_property
+    def vector_store(self) -> Chroma:
+        """Vector store, initialized on first search or write"""
+        return self._initialize_vector_store()
+    
+    @cached_property
+    def index(self) -> QuantizedIndex:
+        """Quantized in-memory copy of the vector store used for candidate search"""
+        # Exact scan unless an LSH prefilter size is configured, e.g. 10000 memory chunks
+        index = QuantizedIndex(lsh_min_size=self.settings.get("lsh_prefilter_min_size"))
+        data = self.vector_store._collection.get(include=["embeddings", "metadatas"])
+        if len(data["ids"]):
+            index.add(data["ids"], data["embeddings"], data["metadatas"])
+        return index
     
     def _load_memories(self) -> List[MemoryEntry]:
         """Load memories from JSONL file"""
         memories = []
-        if self.memory_path.exists():
-            with open(self.memory_path, 'r') as f:
-                for line in f:
-                    if line.strip():  # Skip empty lines
-                        memory_data = json.loads(line)
-                        memories.append(MemoryEntry(**memory_data))
+        if self.memory_path.exists() and self.memory_path.stat().st_size:
+            with open(self.memory_path, 'rb') as f:
+                if not self.use_mmap:
+                    memories = [MEMORY_ADAPTER.validate_json(line) for line in f if line.strip()]
+                else:
+                    # Let the kernel page the file in instead of reading it through Python buffers
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        memories = [MEMORY_ADAPTER.validate_json(line) for line in iter(data.readline, b"") if line.strip()]
         return memories
     
     def _initialize_vector_store(self) -> Chroma:
         """Initialize vector store with existing memories"""
-        documents = []
-        
+        texts = []
+        metadatas = []
         for memory in self.memories:
-            # Create searchable text combining content and context
-            text = self._create_memory_text(memory)
-            
-            # Create metadata for retrieval
-            metadata = {
-                "timestamp": memory.timestamp,
-                "memory_type": memory.memory_type.value,
-                "category": memory.category.value,
-                "importance": memory.importance,
-            }
-            
-            # Split into chunks if needed
-            chunks = self.text_splitter.split_text(text)
-            
-            # Create documents for each chunk
-            for i, chunk in enumerate(chunks):
-                doc = Document(
-                    page_content=chunk,
-                    metadata={
-                        **metadata,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks)
-                    }
-                )
-                documents.append(doc)
+            memory_texts, memory_metadatas = self._memory_chunks(memory)
+            texts.extend(memory_texts)
+            metadatas.extend(memory_metadatas)
         
         # Create and return the vector store
+        # One collection per embedding model, vectors from different models don't mix
         vector_store = Chroma(
-            collection_name="memories",
+            collection_name=f"memories_{self.embeddings.model}",
             embedding_function=self.embeddings,
-            persist_directory=str(self.vector_store_path)
+            persist_directory=str(self.vector_store_path),
+            collection_metadata={"hnsw:space": "cosine"}
         )
         
-        # Only add documents if we have any
-        if documents:
-            vector_store.add_documents(documents=documents)
+        # Only embed chunks the persisted store doesn't have yet
+        ids = self._chunk_ids(metadatas)
+        if ids:
+            existing = set(vector_store.get(ids=ids, include=[])["ids"])
+            new = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+            
+            # Embed everything new in one batched call
+            if new:
+                vector_store.add_texts(
+                    texts=[texts[i] for i in new],
+                    metadatas=[metadatas[i] for i in new],
+                    ids=[ids[i] for i in new]
+                )
             
         return vector_store
     
+    def _chunk_ids(self, metadatas: List[Dict]) -> List[str]:
+        """Deterministic vector store ids for memory chunks"""
+        return [
+            hashlib.blake2b(f"{m['timestamp']}:{m['chunk_index']}".encode(), digest_size=16).hexdigest()
+            for m in metadatas
+        ]
+    
+    def _memory_chunks(self, memory: MemoryEntry) -> Tuple[List[str], List[Dict]]:
+        """Split a memory into searchable chunks with retrieval metadata"""
+        chunks = memory._chunks
+        if chunks is None:
+            # Create searchable text combining content and context
+            text = self._create_memory_text(memory)
+            # Most memories fit in one chunk, no need for the recursive splitter
+            if len(text) <= self.text_splitter._chunk_size:
+                chunks = [text.strip()]
+            else:
+                chunks = self.text_splitter.split_text(text)
+            memory._chunks = chunks
+        
+        metadata = {
+            "timestamp": memory.timestamp,
+            "memory_type": memory.memory_type.value,
+            "category": memory.category.value,
+            "importance": memory.importance,
+            "chunk_index": 0,
+            "total_chunks": len(chunks)
+        }
+        if len(chunks) == 1:
+            return chunks, [metadata]
+        return chunks, [{**metadata, "chunk_index": i} for i in range(len(chunks))]
+    
     def _create_memory_text(self, memory: MemoryEntry) -> str:
         """Create searchable text from memory for embedding"""
         text = f"{memory.content}\nContext: {memory.context}"
-        if memory.metadata:
-            text += f"\nMetadata: {json.dumps(memory.metadata)}"
+        metadata = memory.metadata_dict()
+        if metadata:
+            text += "\nMetadata: " + json.dumps(metadata, separators=(",", ":"))
         if memory.conversation:
             # Include conversation content if available
-            messages = [
-                f"{msg.role}: {msg.content}"
-                for msg in memory.conversation.messages
-            ]
-            text += f"\nConversation:\n{chr(10).join(messages)}"
+            text += "\nConversation:\n" + "\n".join(
+                f"{msg.role}: {msg.content}" for msg in memory.conversation.messages
+            )
         return text
     
     def add_memory(self, memory: MemoryEntry):
         """Add new memory if it meets importance threshold"""
-        if memory.importance >= self.settings["importance_threshold"]:
-            # Create document from memory
-            text = self._create_memory_text(memory)
-            chunks = self.text_splitter.split_text(text)
-            
-            documents = []
-            for i, chunk in enumerate(chunks):
-                doc = Document(
-                    page_content=chunk,
-                    metadata={
-                        "timestamp": memory.timestamp,
-                        "memory_type": memory.memory_type.value,
-                        "category": memory.category.value,
-                        "importance": memory.importance,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks)
-                    }
-                )
-                documents.append(doc)
-            
-            # Add to vector store
-            self.vector_store.add_documents(documents=documents)
-            
-            # Save to JSONL
-            with open(self.memory_path, "a") as f:
-                f.write(memory.model_dump_json() + "\n")
-            
-            self.memories.append(memory)
-            
-            # Check if consolidation is needed
-            self._check_consolidation()
+        self.add_memories([memory])
+    
+    @_locked
+    def add_memories(self, memories: List[MemoryEntry]):
+        """Add new memories that meet the importance threshold, embedding their chunks together"""
+        for memory in memories:
+            if memory.importance >= self.settings["importance_threshold"]:
+                # Near-identical memories update the existing one instead
+                duplicate = self._find_duplicate(memory)
+                if duplicate is not None:
+                    self._merge_duplicate(duplicate, memory)
+                    continue
+                
+                # Queue for the vector store
+                texts, metadatas = self._memory_chunks(memory)
+                self._pending_texts.extend(texts)
+                self._pending_metadatas.extend(metadatas)
+                self._store_memory(memory)
+        
+        if len(self._pending_texts) >= self.INDEX_BATCH_SIZE:
+            self._flush_pending()
+    
+    @_locked
+    def _store_memory(self, memory: MemoryEntry):
+        """Keep memory in memory and save it to JSONL once it is embedded"""
+        self.memories.append(memory)
+        self._by_timestamp[memory.timestamp] = memory
+        self._append_columns(memory)
+        self._remember_fingerprint(memory)
+        self._unwritten.append(memory)
+        self._write_memories()
+    
+    @_locked
+    def _write_memories(self, embedded_only: bool = True):
+        """Write stored memories to JSONL in order, by default up to the first one still waiting for its embedding"""
+        while self._unwritten and (not embedded_only or self._unwritten[0].embedding is not None):
+            self._memory_fh.write(self._dump_memory(self._unwritten.popleft()))
+    
+    def _fingerprint(self, memory: MemoryEntry) -> bytes:
+        """Hash of a memory's normalized content"""
+        return hashlib.blake2b(memory.content.strip().lower().encode(), digest_size=8).digest()
+    
+    def _remember_fingerprint(self, memory: MemoryEntry):
+        """Track a memory among the recent ones checked for duplicates"""
+        # Conversation memories share boilerplate content, they're never duplicates
+        if memory.memory_type == MemoryType.CONVERSATION:
+            return
+        fingerprint = self._fingerprint(memory)
+        self._recent_fingerprints[fingerprint] = memory.timestamp
+        self._recent_fingerprints.move_to_end(fingerprint)
+        if len(self._recent_fingerprints) > self.DEDUP_WINDOW:
+            self._recent_fingerprints.popitem(last=False)
+    
+    def _find_duplicate(self, memory: MemoryEntry) -> Optional[MemoryEntry]:
+        """A recent memory with the same normalized content"""
+        if memory.memory_type == MemoryType.CONVERSATION:
+            return None
+        
+        timestamp = self._recent_fingerprints.get(self._fingerprint(memory))
+        return self._by_timestamp.get(timestamp) if timestamp is not None else None
+    
+    def _merge_duplicate(self, existing: MemoryEntry, memory: MemoryEntry):
+        """Fold a duplicate into the existing memory: count it as an access and keep any new metadata"""
+        existing.access_count += 1
+        self._columns["access_count"][self._rows[existing.timestamp]] += 1
+        existing.metadata = METADATA_ADAPTER.validate_python({
+            **memory.metadata_dict(),
+            **existing.metadata_dict()
+        })
+    
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Per-field arrays over self.memories for vectorized filtering"""
+        return {field: values[:len(self.memories)] for field, values in self._columns.items()}
+    
+    def _build_columns(self):
+        """Build the per-field column buffers from self.memories"""
+        self._rows = {m.timestamp: i for i, m in enumerate(self.memories)}
+        # Buffers grown by grow_buffers; rows past len(self.memories) are unused
+        self._columns = {
+            field: np.array([getattr(m, field) for m in self.memories], dtype=dtype)
+            for field, dtype in self.COLUMN_DTYPES.items()
+        }
+    
+    def _append_columns(self, memory: MemoryEntry):
+        """Add the last appended memory to the column buffers"""
+        row = len(self.memories) - 1
+        self._rows[memory.timestamp] = row
+        self._columns = grow_buffers(self._columns, row + 1, row)
+        for field, values in self._columns.items():
+            values[row] = getattr(memory, field)
+    
+    def _dump_memory(self, memory: MemoryEntry) -> bytes:
+        """Serialize a memory as a JSONL line"""
+        # Conversations streamed to their own file aren't duplicated here
+        exclude = {"conversation"} if getattr(memory.metadata, "conversation_path", None) else None
+        return MEMORY_ADAPTER.dump_json(memory, exclude=exclude) + b"\n"
+    
+    @_locked
+    def _take_pending(self) -> Tuple[List[str], List[Dict]]:
+        """Take all queued chunks off the queue"""
+        texts, metadatas = self._pending_texts, self._pending_metadatas
+        self._pending_texts, self._pending_metadatas = [], []
+        return texts, metadatas
+    
+    @_locked
+    def _flush_pending(self):
+        """Embed and add all queued chunks to the vector store in one call"""
+        if self._pending_texts:
+            texts, metadatas = self._take_pending()
+            self._add_chunks(texts, metadatas, self.embeddings.embed_documents(texts))
+    
+    async def _aflush_pending(self):
+        """Async version of _flush_pending"""
+        if self._pending_texts:
+            texts, metadatas = self._take_pending()
+            self._add_chunks(texts, metadatas, await self.embeddings.aembed_documents(texts))
+    
+    @_locked
+    def _add_chunks(self, texts: List[str], metadatas: List[Dict], embeddings: List[List[float]]):
+        """Add embedded chunks to the vector store and the quantized index"""
+        ids = self._chunk_ids(metadatas)
+        self.vector_store._collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=metadatas
+        )
+        self.index.add(ids, embeddings, metadatas)
+        
+        # Keep a quantized copy of each stored memory's first chunk embedding on the memory itself
+        for metadata, vector in zip(metadatas, embeddings):
+            memory = self._by_timestamp.get(metadata["timestamp"])
+            if metadata["chunk_index"] == 0 and memory is not None and memory.embedding is None:
+                memory.embedding = MemoryEmbedding.from_vector(vector, self.embeddings.model)
+        self._write_memories()
+    
+    @_locked
+    def flush(self):
+        """Write out all queued vector store additions and buffered JSONL lines"""
+        self._flush_pending()
+        self._write_memories(embedded_only=False)
+        self._memory_fh.flush()
+    
+    @_locked
+    def close(self):
+        """Flush and close the JSONL file"""
+        if not self._memory_fh.closed:
+            self.flush()
+            self._memory_fh.close()
     
     async def aget_relevant_memories(
         self, 
         context: str, 
         memory_type: Optional[MemoryType] = None,
         category: Optional[MemoryCategory] = None,
-        limit: int = 5
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[MemoryEntry]:
         """Async version of get_relevant_memories"""
-        filter_dict = {}
-        if memory_type:
-            filter_dict["memory_type"] = memory_type.value
-        if category:
-            filter_dict["category"] = category.value
-            
-        results = await self.vector_store.asimilarity_search_with_relevance_scores(
-            query=context,
-            k=limit * 2,
-            filter=filter_dict if filter_dict else None
-        )
-        return self._process_search_results(results, limit)
+        await self._aflush_pending()
+        if query_embedding is None:
+            query_embedding = await self.embeddings.aembed_query(context)
+        return self._search(query_embedding, memory_type, category, limit)
     
     def get_relevant_memories(
         self, 
         context: str, 
         memory_type: Optional[MemoryType] = None,
         category: Optional[MemoryCategory] = None,
-        limit: int = 5
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[MemoryEntry]:
-        """Get relevant memories using semantic search with optional filters"""
+        """
+        Get relevant memories using semantic search with optional filters.
+        The context is embedded unless its embedding is passed as query_embedding.
+        """
+        self._flush_pending()
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(context)
+        return self._search(query_embedding, memory_type, category, limit)
+    
+    @_locked
+    def _search(
+        self,
+        query: List[float],
+        memory_type: Optional[MemoryType],
+        category: Optional[MemoryCategory],
+        limit: int
+    ) -> List[MemoryEntry]:
+        """Find candidates in the quantized index, then rerank them with full-precision vectors"""
         filter_dict = {}
         if memory_type:
             filter_dict["memory_type"] = memory_type.value
         if category:
             filter_dict["category"] = category.value
-            
-        results = self.vector_store.similarity_search_with_relevance_scores(
-            query=context,
-            k=limit * 2,
-            filter=filter_dict if filter_dict else None
-        )
+        
+        k = limit * 2
+        candidates = self.index.search(query, k=k * 4, filter=filter_dict)
+        if not candidates:
+            return []
+        
+        data = self.vector_store._collection.get(ids=candidates, include=["embeddings", "metadatas"])
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        scores = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+        
+        top = top_k(scores, k)
+        results = [(data["metadatas"][i], float(scores[i])) for i in top.tolist()]
         return self._process_search_results(results, limit)
     
     def _process_search_results(self, results, limit: int) -> List[MemoryEntry]:
         """Process search results and apply filters"""
         relevant_memories = []
         seen_timestamps = set()
+        # Optional cosine similarity below which memories aren't considered relevant
+        min_score = self.settings.get("min_relevance_score")
         
-        for doc, score in results:
+        for metadata, score in results:
+            # Results are sorted by score, nothing after this is relevant enough
+            if min_score is not None and score < min_score:
+                break
+            
             # Find matching memory
-            timestamp = doc.metadata["timestamp"]
+            timestamp = metadata["timestamp"]
             if timestamp in seen_timestamps:
                 continue
                 
-            memory = next(
-                (m for m in self.memories if m.timestamp == timestamp),
-                None
-            )
+            memory = self._by_timestamp.get(timestamp)
             
             if memory:
                 # Update access metrics
                 memory.last_accessed = datetime.now().isoformat()
                 memory.access_count += 1
+                self._columns["access_count"][self._rows[timestamp]] += 1
                 relevant_memories.append(memory)
                 seen_timestamps.add(timestamp)
                 
@@ -204,21 +441,70 @@ class MemorySystem:
         
         return relevant_memories
     
-    def _check_consolidation(self):
-        """Check if memory consolidation is needed"""
+    async def consolidation_loop(self):
+        """Consolidate memories in the background every consolidation interval"""
         consolidation_interval = timedelta(
             hours=self.settings.get("consolidation_interval_hours", 24)
         )
-        
-        if datetime.now() - self.last_consolidation > consolidation_interval:
-            self._consolidate_memories()
+        while True:
+            # Wake up when the interval since the last consolidation elapses
+            next_consolidation = self.last_consolidation + consolidation_interval
+            await asyncio.sleep(max((next_consolidation - datetime.now()).total_seconds(), 0))
+            if datetime.now() >= self.last_consolidation + consolidation_interval:
+                try:
+                    await self.aconsolidate_memories()
+                except Exception:
+                    # Try again at the next interval instead of ending the loop
+                    logger.exception("Memory consolidation failed")
     
     def _consolidate_memories(self):
         """Consolidate memories to form higher-level insights"""
+        with self._consolidation_lock:
+            self.last_consolidation = datetime.now()
+            consolidated = self._build_consolidated_memories()
+            remaining = consolidated
+            if self.settings.get("use_synthetic_consolidation_embeddings"):
+                remaining = self._add_with_synthetic_embeddings(consolidated)
+            self._store_consolidated(consolidated, remaining)
+    
+    async def aconsolidate_memories(self):
+        """
+        Async version of _consolidate_memories.
+        With use_batch_consolidation enabled, embeddings go through the OpenAI Batch API
+        (half the price, completes asynchronously); otherwise or on failure, falls back to the regular path.
+        Blocking work runs in a thread so the event loop stays responsive.
+        """
+        if not self.settings.get("use_batch_consolidation"):
+            await asyncio.to_thread(self._consolidate_memories)
+            return
+        
+        # Skip this round if a consolidation is already running, e.g. from save_all
+        if not self._consolidation_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_consolidation = datetime.now()
+            consolidated = await asyncio.to_thread(self._build_consolidated_memories)
+            remaining = consolidated
+            if self.settings.get("use_synthetic_consolidation_embeddings"):
+                remaining = await asyncio.to_thread(self._add_with_synthetic_embeddings, consolidated)
+            
+            if remaining:
+                try:
+                    await self._aadd_memories_via_batch(remaining)
+                    remaining = []
+                except (OpenAIError, RuntimeError):
+                    pass
+            await asyncio.to_thread(self._store_consolidated, consolidated, remaining)
+        finally:
+            self._consolidation_lock.release()
+    
+    @_locked
+    def _build_consolidated_memories(self) -> List[MemoryEntry]:
+        """Create consolidated memories from the unconsolidated ones, grouped by category"""
         # Get unconsolidated memories
         unconsolidated = [m for m in self.memories if not m.consolidated]
         if len(unconsolidated) < 2:
-            return
+            return []
         
         # Group by category
         by_category = {}
@@ -228,6 +514,7 @@ class MemorySystem:
             by_category[memory.category].append(memory)
         
         # For each category with multiple memories
+        consolidated = []
         for category, memories in by_category.items():
             if len(memories) < 2:
                 continue
@@ -236,50 +523,181 @@ class MemorySystem:
             content = f"Consolidated insights from {len(memories)} memories about {category}:\n"
             content += "\n".join([f"- {m.content}" for m in memories])
             
-            consolidated_memory = MemoryEntry(
+            consolidated.append(MemoryEntry(
                 timestamp=datetime.now().isoformat(),
                 memory_type=MemoryType.SEMANTIC,
                 category=category,
                 content=content,
                 context=f"Memory consolidation for category {category}",
                 importance=max(m.importance for m in memories),
-                metadata={
-                    "consolidated_from": [m.timestamp for m in memories],
-                    "memory_count": len(memories)
-                },
+                metadata=MemoryMetadata(
+                    consolidated_from=[m.timestamp for m in memories],
+                    memory_count=len(memories)
+                ),
                 references=[m.timestamp for m in memories],
                 consolidated=True
-            )
-            
-            # Add the consolidated memory
-            self.add_memory(consolidated_memory)
-            
-            # Mark source memories as consolidated
-            for memory in memories:
-                memory.consolidated = True
+            ))
         
-        self.last_consolidation = datetime.now()
+        return consolidated
     
+    @_locked
+    def _store_consolidated(self, consolidated: List[MemoryEntry], remaining: List[MemoryEntry]):
+        """Add the consolidated memories not added yet, then mark the sources of all of them"""
+        self.add_memories(remaining)
+        for memory in consolidated:
+            for timestamp in memory.references:
+                source = self._by_timestamp.get(timestamp)
+                if source is not None:
+                    source.consolidated = True
+                    self._columns["consolidated"][self._rows[timestamp]] = True
+    
+    @_locked
+    def _add_with_synthetic_embeddings(self, memories: List[MemoryEntry]) -> List[MemoryEntry]:
+        """
+        Add consolidated memories embedded as the importance-weighted average of their sources,
+        without calling the embedding API. Returns the memories whose sources aren't indexed.
+        """
+        remaining = []
+        for memory in memories:
+            if memory.importance < self.settings["importance_threshold"]:
+                continue
+            vector = self._synthetic_embedding(memory)
+            if vector is None:
+                remaining.append(memory)
+                continue
+            texts, metadatas = self._memory_chunks(memory)
+            self._add_chunks(texts, metadatas, [vector.tolist()] * len(texts))
+            memory.embedding = MemoryEmbedding.from_vector(vector, self.embeddings.model)
+            self._store_memory(memory)
+        return remaining
+    
+    def _synthetic_embedding(self, memory: MemoryEntry) -> Optional[np.ndarray]:
+        """Importance-weighted average of the embeddings of the memories it references"""
+        # Sources may still be waiting to be indexed
+        self._flush_pending()
+        data = self.vector_store._collection.get(
+            where={"timestamp": {"$in": memory.references}},
+            include=["embeddings", "metadatas"]
+        )
+        if not len(data["ids"]):
+            return None
+        
+        # Average each source's chunks, then weight sources by importance
+        chunks_by_source = {}
+        importance_by_source = {}
+        for vector, metadata in zip(data["embeddings"], data["metadatas"]):
+            chunks_by_source.setdefault(metadata["timestamp"], []).append(vector)
+            importance_by_source[metadata["timestamp"]] = metadata["importance"]
+        
+        sources = list(chunks_by_source)
+        vectors = np.array([np.mean(chunks_by_source[ts], axis=0) for ts in sources], dtype=np.float32)
+        vector = np.average(vectors, axis=0, weights=[importance_by_source[ts] for ts in sources])
+        return vector / np.linalg.norm(vector)
+    
+    async def _aadd_memories_via_batch(self, memories: List[MemoryEntry]):
+        """Add memories with embeddings computed through the OpenAI Batch API"""
+        memories = [m for m in memories if m.importance >= self.settings["importance_threshold"]]
+        texts = []
+        metadatas = []
+        first_chunks = []
+        for memory in memories:
+            memory_texts, memory_metadatas = self._memory_chunks(memory)
+            first_chunks.append(len(texts))
+            texts.extend(memory_texts)
+            metadatas.extend(memory_metadatas)
+        if not texts:
+            return
+        
+        embeddings = await self._abatch_embed(texts)
+        
+        # Add precomputed embeddings directly, without another embedding call
+        self._add_chunks(texts, metadatas, embeddings)
+        for memory, first_chunk in zip(memories, first_chunks):
+            memory.embedding = MemoryEmbedding.from_vector(embeddings[first_chunk], self.embeddings.model)
+            self._store_memory(memory)
+    
+    async def _abatch_embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with an OpenAI batch job and wait for it to complete"""
+        client = AsyncOpenAI()
+        requests = b"".join(
+            orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {"model": self.embeddings.model, "input": text}
+            }) + b"\n"
+            for i, text in enumerate(texts)
+        )
+        batch_file = await client.files.create(
+            file=("consolidation_embeddings.jsonl", requests),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h"
+        )
+        
+        poll_interval = self.settings.get("batch_poll_interval_seconds", 60)
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Embedding batch {batch.id} ended with status {batch.status}")
+        
+        output = await client.files.content(batch.output_file_id)
+        embeddings = [None] * len(texts)
+        for line in output.text.splitlines():
+            if line.strip():
+                result = orjson.loads(line)
+                if result.get("error") is None:
+                    embeddings[int(result["custom_id"])] = result["response"]["body"]["data"][0]["embedding"]
+        
+        if any(e is None for e in embeddings):
+            raise RuntimeError(f"Embedding batch {batch.id} is missing results")
+        return embeddings
+    
+    @_locked
     def prune_memories(self):
         """Remove old, low-importance memories based on settings"""
         retention_days = self.settings.get("memory_retention_days", 30)
         cutoff_date = datetime.now() - timedelta(days=retention_days)
         importance_threshold = self.settings.get("pruning_importance_threshold", 5)
         
+        # Make sure every memory is on disk and indexed before pruning
+        self.flush()
+        old_timestamps = {m.timestamp for m in self.memories}
+        
         # Keep memories that are either:
         # 1. Recent enough
         # 2. Important enough
         # 3. Frequently accessed
         # 4. Consolidated insights
-        self.memories = [
-            m for m in self.memories
-            if (
-                datetime.fromisoformat(m.timestamp) > cutoff_date or
-                m.importance >= importance_threshold or
-                m.access_count >= self.settings.get("min_access_keep", 3) or
-                m.consolidated
-            )
-        ]
+        columns = self.columns
+        keep = (
+            (columns["timestamp"] > np.datetime64(cutoff_date, "us")) |
+            (columns["importance"] >= importance_threshold) |
+            (columns["access_count"] >= self.settings.get("min_access_keep", 3)) |
+            columns["consolidated"]
+        )
+        self.memories = [m for m, k in zip(self.memories, keep.tolist()) if k]
+        self._build_columns()
+        
+        self._by_timestamp = {m.timestamp: m for m in self.memories}
+        pruned = old_timestamps - self._by_timestamp.keys()
+        if not pruned:
+            return
+        
+        # Drop only the pruned chunks instead of re-embedding the survivors
+        self.vector_store.delete(where={"timestamp": {"$in": list(pruned)}})
+        self.index.remove_where("timestamp", pruned)
         
-        # Rebuild vector store
-        self.vector_store = self._initialize_vector_store() 
\ No newline at end of file
+        # Rewrite JSONL with the surviving memories
+        self._memory_fh.close()
+        tmp_path = self.memory_path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "wb") as f:
+            for memory in self.memories:
+                f.write(self._dump_memory(memory))
+        os.replace(tmp_path, self.memory_path)
+        self._memory_fh = open(self.memory_path, "ab", buffering=1 << 16)
@@ -1,11 +1,49 @@
 import yaml
-import json
+import orjson
+import os
+import sys
+import atexit
 from datetime import datetime, timedelta
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict
-from schema import Identity, State, MemoryEntry, Action, Reflection, Message, Conversation, MemoryType, MemoryCategory
+from schema import Identity, State, MemoryEntry, MemoryMetadata, Action, Reflection, Message, Conversation, MemoryType, MemoryCategory, STATE_ADAPTER, MESSAGE_ADAPTER
 from memory_system import MemorySystem
 
+# libyaml-backed loader when available, it's much faster than the pure-Python one
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Enum members bound once; member access on the enum class goes through a descriptor each time
+_MT_CONV = MemoryType.CONVERSATION
+_MT_REFL = MemoryType.REFLECTION
+_MT_SEM = MemoryType.SEMANTIC
+_MC_HI = MemoryCategory.HUMAN_INTERACTION
+_MC_SA = MemoryCategory.SELF_AWARENESS
+
+def _now_iso() -> str:
+    """Current local time as an ISO 8601 string"""
+    return datetime.now().isoformat()
+
+def _read_last_jsonl_line(path: Path, chunk_size: int = 4096) -> Optional[bytes]:
+    """Read the last non-empty line of a JSONL file, reading backwards from the end"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        tail = b""
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            # Stop once there's a newline before the (non-empty) last line
+            stripped = tail.rstrip(b"\r\n")
+            if b"\n" in stripped:
+                return stripped.rsplit(b"\n", 1)[1]
+        return tail.strip() or None
+
 class MiDO:
     def __init__(self, mido_name: str):
         self.mido_dir = Path("midos") / mido_name
@@ -14,23 +52,38 @@ class MiDO:
         
         self.config_path = self.mido_dir / "mido.yaml"
         self.state_path = self.mido_dir / "state.jsonl"
+        self.conversations_dir = self.mido_dir / "conversations"
         
         # Load configuration
         self._load_config()
         
         # Initialize memory system
-        self.memory_system = MemorySystem(self.mido_dir, self.memory_settings)
+        self.memory_system = MemorySystem(self.mido_dir, self.memory_settings, use_mmap=True)
         
         # Initialize or load state
         self.current_state = self._load_or_init_state()
+        # Whether current_state hasn't been written to state.jsonl yet
+        self._state_dirty = self.current_state is self.initial_state
         
-        # Current conversation
+        # States are appended through one buffered handle, flushed in save_all
+        self._state_fh = open(self.state_path, "ab", buffering=1 << 16)
+        
+        # Current conversation. Messages are streamed to a per-conversation JSONL file,
+        # only the most recent ones are kept in memory.
         self.current_conversation = Conversation(messages=[], summary=None)
+        self.conversation_window = self.interaction_settings.get("conversation_window", 20)
+        self.conversation_length = 0
+        self._conversation_path: Optional[Path] = None
+        self._conversation_fh = None
+        atexit.register(self.close)
+        
+        # Conversations are saved in the background, off the interactive path
+        self._writer = ThreadPoolExecutor(max_workers=1)
 
     def _load_config(self):
         """Load MiDO configuration from YAML"""
         with open(self.config_path) as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=_YamlLoader)
             self.identity = Identity(**config["identity"])
             self.initial_state = State(**config["initial_state"])
             self.memory_settings = config["memory_settings"]
@@ -41,106 +94,191 @@ class MiDO:
         if not self.state_path.exists() or self.state_path.stat().st_size == 0:
             return self.initial_state
         
-        with open(self.state_path) as f:
-            states = [json.loads(line) for line in f]
-            if states:
-                return State(**states[-1])
-            return self.initial_state
+        line = _read_last_jsonl_line(self.state_path)
+        if line:
+            return State(**orjson.loads(line))
+        return self.initial_state
 
     def save_state(self, state: State):
         """Save current state to JSONL file"""
-        with open(self.state_path, "a") as f:
-            f.write(state.model_dump_json() + "\n")
+        self._state_fh.write(STATE_ADAPTER.dump_json(state) + b"\n")
         self.current_state = state
+        self._state_dirty = False
 
     def add_message(self, role: str, content: str):
         """Add a message to the current conversation"""
+        # Interned, so the few distinct roles are shared and compare by identity
+        role = sys.intern(role)
         message = Message(
             role=role,
             content=content,
-            timestamp=datetime.now().isoformat()
+            timestamp=_now_iso()
         )
-        self.current_conversation.messages.append(message)
+        if self._conversation_fh is None:
+            self._open_conversation_file(message.timestamp)
+        self._conversation_fh.write(MESSAGE_ADAPTER.dump_json(message) + b"\n")
+        
+        messages = self.current_conversation.messages
+        messages.append(message)
+        if len(messages) > self.conversation_window:
+            del messages[0]
+        self.current_conversation.roles.add(role)
+        self.conversation_length += 1
+
+    def _open_conversation_file(self, timestamp: str):
+        """Start the JSONL file for a new conversation, named after its first message"""
+        self.conversations_dir.mkdir(exist_ok=True)
+        self._conversation_path = self.conversations_dir / f"{timestamp.replace(':', '')}.jsonl"
+        self._conversation_fh = open(self._conversation_path, "ab")
 
     def save_conversation(self):
-        """Save current conversation as a memory entry"""
-        if not self.current_conversation.messages:
+        """Save current conversation as a memory entry in the background"""
+        if not self.conversation_length:
             return
 
-        memory = MemoryEntry(
-            timestamp=datetime.now().isoformat(),
-            memory_type=MemoryType.CONVERSATION,
-            category=MemoryCategory.HUMAN_INTERACTION,
-            content=f"Conversation with {len(self.current_conversation.messages)} messages",
-            context=self.current_state.conversation_context or "General interaction",
+        # Hand the conversation over to the writer and start a new one
+        self._conversation_fh.close()
+        self._writer.submit(
+            self._save_conversation,
+            self.current_conversation,
+            self.conversation_length,
+            self._conversation_path.relative_to(self.mido_dir).as_posix(),
+            self.current_state,
+            _now_iso()
+        )
+        self.current_conversation = Conversation(messages=[], summary=None)
+        self.conversation_length = 0
+        self._conversation_path = None
+        self._conversation_fh = None
+
+    def _save_conversation(
+        self,
+        conversation: Conversation,
+        message_count: int,
+        conversation_path: str,
+        state: State,
+        timestamp: str
+    ):
+        """Store a finished conversation as a memory entry, with the recent messages and a pointer to all of them"""
+        # Built from trusted values, skip validation; unset fields get their defaults
+        memory = MemoryEntry.model_construct(
+            timestamp=timestamp,
+            memory_type=_MT_CONV,
+            category=_MC_HI,
+            content=f"Conversation with {message_count} messages",
+            context=state.conversation_context or "General interaction",
             importance=5,  # Default importance for conversations
-            conversation=self.current_conversation,
-            metadata={
-                "message_count": len(self.current_conversation.messages),
-                "participants": list(set(m.role for m in self.current_conversation.messages))
-            }
+            conversation=conversation,
+            metadata=MemoryMetadata(
+                message_count=message_count,
+                participants=list(conversation.roles),
+                conversation_path=conversation_path
+            )
         )
         self.memory_system.add_memory(memory)
-        
-        # Start a new conversation
-        self.current_conversation = Conversation(messages=[], summary=None)
 
-    def save_all(self):
-        """Save all current state before shutdown"""
-        # Save the current conversation if any
-        if self.current_conversation.messages:
+    def load_conversation(self, memory: MemoryEntry) -> Optional[Conversation]:
+        """Full conversation of a conversation memory, read from its file when it has one"""
+        conversation_path = getattr(memory.metadata, "conversation_path", None)
+        if conversation_path:
+            return MemoryEntry.load_conversation(self.mido_dir / conversation_path)
+        return memory.conversation
+
+    def save_all(self, durable: bool = False):
+        """Save all current state before shutdown, fsyncing the state file if durable"""
+        # Save the current conversation if any, and wait for pending saves
+        if self.conversation_length:
             self.save_conversation()
+        self._writer.shutdown(wait=True)
         
         # Save the final state if it's not already saved
-        if self.current_state:
+        if self._state_dirty:
             self.save_state(self.current_state)
+        self._state_fh.flush()
+        if durable:
+            os.fsync(self._state_fh.fileno())
         
         # Trigger memory consolidation
         self.memory_system._consolidate_memories()
+        
+        # Write out queued memories
+        self.memory_system.flush()
+
+    def close(self):
+        """Flush and close the state and conversation files"""
+        if not self._state_fh.closed:
+            self._state_fh.close()
+        if self._conversation_fh is not None and not self._conversation_fh.closed:
+            self._conversation_fh.close()
+
+    def __del__(self):
+        if hasattr(self, "_conversation_fh"):
+            self.close()
 
     def get_relevant_memories(
         self, 
         context: str, 
         memory_type: Optional[MemoryType] = None,
         category: Optional[MemoryCategory] = None,
-        limit: int = 5
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[MemoryEntry]:
-        """Get relevant memories based on context and optional filters"""
+        """Get relevant memories based on context and optional filters, reusing the context's embedding if given"""
         return self.memory_system.get_relevant_memories(
             context=context,
             memory_type=memory_type,
             category=category,
-            limit=limit
+            limit=limit,
+            query_embedding=query_embedding
+        )
+
+    async def aget_relevant_memories(
+        self, 
+        context: str, 
+        memory_type: Optional[MemoryType] = None,
+        category: Optional[MemoryCategory] = None,
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[MemoryEntry]:
+        """Async version of get_relevant_memories"""
+        return await self.memory_system.aget_relevant_memories(
+            context=context,
+            memory_type=memory_type,
+            category=category,
+            limit=limit,
+            query_embedding=query_embedding
         )
 
     def add_reflection(self, content: str, importance: int = 7):
         """Add a reflection memory"""
         memory = MemoryEntry(
-            timestamp=datetime.now().isoformat(),
-            memory_type=MemoryType.REFLECTION,
-            category=MemoryCategory.SELF_AWARENESS,
+            timestamp=_now_iso(),
+            memory_type=_MT_REFL,
+            category=_MC_SA,
             content=content,
             context=f"Reflecting on state: {self.current_state.current_focus}",
             importance=importance,
-            metadata={
-                "emotional_state": self.current_state.emotional_state,
-                "energy_level": self.current_state.energy_level
-            }
+            metadata=MemoryMetadata(
+                emotional_state=self.current_state.emotional_state,
+                energy_level=self.current_state.energy_level
+            )
         )
         self.memory_system.add_memory(memory)
 
     def add_learning(self, content: str, category: MemoryCategory, importance: int = 6):
         """Add a learning memory"""
         memory = MemoryEntry(
-            timestamp=datetime.now().isoformat(),
-            memory_type=MemoryType.SEMANTIC,
+            timestamp=_now_iso(),
+            memory_type=_MT_SEM,
             category=category,
             content=content,
             context=f"Learning during: {self.current_state.current_focus}",
             importance=importance,
-            metadata={
-                "source": "interaction",
-                "state": self.current_state.model_dump()
-            }
+            metadata=MemoryMetadata(
+                source="interaction",
+                emotional_state=self.current_state.emotional_state,
+                energy_level=self.current_state.energy_level,
+                focus=self.current_state.current_focus
+            )
         )
         self.memory_system.add_memory(memory) 
\ No newline at end of file
@@ -0,0 +1,125 @@
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+import tiktoken
+
+# Extra tokens per message for role and formatting
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_SPACES = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n[ \t]*(?:\n[ \t]*)+")
+_CODE_FENCE = "```"
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> tiktoken.Encoding:
+    """Tokenizer for a model, falling back to cl100k_base for non-OpenAI models"""
+    try:
+        return tiktoken.encoding_for_model(model.split("/")[-1])
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines, leaving fenced code untouched"""
+    parts = text.split(_CODE_FENCE)
+    # Even parts are outside code fences
+    for i in range(0, len(parts), 2):
+        parts[i] = _BLANK_LINES.sub("\n\n", _SPACES.sub(" ", parts[i]))
+    return _CODE_FENCE.join(parts).strip()
+
+def _compress_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of a system message with whitespace collapsed in its text"""
+    content = message.get("content")
+    if message["role"] != "system":
+        # User and assistant content is passed through verbatim
+        return message
+    if isinstance(content, str):
+        return {**message, "content": collapse_whitespace(content)}
+    if isinstance(content, list):
+        # Content blocks, e.g. [{"type": "text", "text": ...}]
+        blocks = [
+            {**block, "text": collapse_whitespace(block["text"])} if block.get("type") == "text" else block
+            for block in content
+        ]
+        return {**message, "content": blocks}
+    return message
+
+def _message_text(message: Dict[str, Any]) -> str:
+    """Text of a message for token counting"""
+    content = message.get("content")
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content)
+    return content or ""
+
+def _within_budget(texts: List[str], budget_tokens: int) -> bool:
+    """Cheap check that skips the tokenizer: a BPE token is at least one UTF-8 byte"""
+    return sum(len(text.encode()) + MESSAGE_OVERHEAD_TOKENS for text in texts) <= budget_tokens
+
+def count_tokens(messages: List[Dict[str, Any]], model: str) -> int:
+    """Approximate number of prompt tokens for the messages"""
+    encoding = _encoding(model)
+    return sum(
+        len(encoding.encode(_message_text(m))) + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    )
+
+def compress(
+    messages: List[Dict[str, Any]],
+    model: str,
+    budget_tokens: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Shrink messages before sending them to the LLM.
+    Collapses whitespace in system prompts, then, if over the token budget,
+    drops the oldest turns while always keeping system messages and the latest turn.
+    The input messages are not modified.
+    """
+    messages = [_compress_message(m) for m in messages]
+    if budget_tokens is None or _within_budget([_message_text(m) for m in messages], budget_tokens):
+        return messages
+
+    # Group each message with the tool results that follow it, so tool calls
+    # and their results are kept or dropped together
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages:
+        if message["role"] == "tool" and turns:
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+
+    if all(turn[0]["role"] == "system" for turn in turns[:-1]):
+        # Nothing can be dropped, so there is no point in counting
+        return messages
+
+    counts = [count_tokens(turn, model) for turn in turns]
+    total = sum(counts)
+    dropped = set()
+    for i, turn in enumerate(turns[:-1]):
+        if total <= budget_tokens:
+            break
+        if turn[0]["role"] == "system":
+            continue
+        dropped.add(i)
+        total -= counts[i]
+
+    return [m for i, turn in enumerate(turns) if i not in dropped for m in turn]
+
+def drop_to_budget(
+    required: List[str],
+    droppable: List[str],
+    model: str,
+    budget_tokens: int
+) -> int:
+    """
+    Number of leading droppable texts to leave out so that they and the
+    required texts fit the token budget.
+    """
+    if _within_budget(required + droppable, budget_tokens):
+        return 0
+    encoding = _encoding(model)
+    counts = [len(encoding.encode(text)) + MESSAGE_OVERHEAD_TOKENS for text in droppable]
+    total = sum(counts) + sum(len(encoding.encode(text)) + MESSAGE_OVERHEAD_TOKENS for text in required)
+    for i, count in enumerate(counts):
+        if total <= budget_tokens:
+            return i
+        total -= count
+    return len(droppable)
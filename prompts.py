@@ -10,7 +10,9 @@ You can use the available functions to take actions. Currently, you can:
 
 Your response should use the appropriate function to take action."""
 
-ACTION_USER_PROMPT = """Current State:
+def render_action(state: str, memories: str, conversation: str, user_input: str) -> str:
+    """User prompt for an action call"""
+    return f"""Current State:
 {state}
 
 Recent Memories:
@@ -31,7 +33,9 @@ Your role is to:
 
 You can use the reflect function to provide your reflection."""
 
-REFLECTION_USER_PROMPT = """Current State:
+def render_reflection(state: str, action: str, conversation: str, user_input: str) -> str:
+    """User prompt for a reflection call"""
+    return f"""Current State:
 {state}
 
 Action Taken:
@@ -1,7 +1,12 @@
+import mmap
 from enum import Enum
-from typing import Optional, List, Dict, Union
-from pydantic import BaseModel, Field
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Annotated, Any, Optional, List, Dict, Set, Union
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, TypeAdapter, model_serializer
 from datetime import datetime
+import numpy as np
+from vector_index import quantize_int8, dequantize_int8
 
 class ActionType(str, Enum):
     SPEAK = "speak"
@@ -24,10 +29,14 @@ class MemoryCategory(str, Enum):
     KNOWLEDGE = "knowledge"
 
 class Action(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     type: ActionType = Field(description="The type of action to take")
     content: str = Field(description="The content of the action (e.g., message to speak)")
 
 class State(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     current_focus: str = Field(description="What the MiDO is currently focused on")
     emotional_state: str = Field(description="Current emotional state")
     energy_level: int = Field(description="Energy level from 1-100", ge=1, le=100)
@@ -35,19 +44,60 @@ class State(BaseModel):
     last_interaction: Optional[str] = Field(description="The last interaction with the user")
     conversation_context: Optional[str] = Field(description="Current conversation context")
 
-class Message(BaseModel):
-    role: str = Field(description="Who sent the message (user or assistant)")
-    content: str = Field(description="The actual message content")
-    timestamp: str = Field(description="ISO format timestamp of when the message was sent")
+@dataclass(slots=True, frozen=True)
+class Message:
+    """The most numerous object, kept as a slotted dataclass; serialized with MESSAGE_ADAPTER"""
+    role: Annotated[str, Field(description="Who sent the message (user or assistant)")]
+    content: Annotated[str, Field(description="The actual message content")]
+    timestamp: Annotated[str, Field(description="ISO format timestamp of when the message was sent")]
 
 class Conversation(BaseModel):
     messages: List[Message] = Field(description="List of messages in the conversation")
     summary: Optional[str] = Field(description="Optional summary of the conversation")
+    roles: Set[str] = Field(default_factory=set, exclude=True, description="Roles that have sent messages, tracked as they are added")
 
 class MemoryEmbedding(BaseModel):
-    vector: List[float] = Field(description="The embedding vector for this memory")
+    """int8 quantized embedding, the original vector is approximately scale * vector"""
+    model_config = ConfigDict(defer_build=True, ser_json_bytes="base64", val_json_bytes="base64")
+
+    vector: bytes = Field(description="The int8 quantized embedding vector")
+    scale: float = Field(description="Scale to multiply the int8 values by")
     model: str = Field(description="The model used to generate this embedding")
 
+    @classmethod
+    def from_vector(cls, vector, model: str) -> "MemoryEmbedding":
+        """Quantize a float embedding vector"""
+        quantized, scales = quantize_int8(vector)
+        return cls(vector=quantized[0].tobytes(), scale=float(scales[0]), model=model)
+
+    def to_vector(self) -> np.ndarray:
+        """Dequantized float32 embedding vector"""
+        return dequantize_int8(np.frombuffer(self.vector, dtype=np.int8), self.scale)[0]
+
+class MemoryMetadata(BaseModel):
+    """Known metadata fields are typed, anything else is kept as is"""
+    model_config = ConfigDict(extra="allow")
+
+    source: Optional[str] = None
+    message_count: Optional[int] = None
+    participants: Optional[List[str]] = None
+    emotional_state: Optional[str] = None
+    energy_level: Optional[int] = None
+    focus: Optional[str] = None
+    state: Optional[Dict] = None
+    consolidated_from: Optional[List[str]] = None
+    memory_count: Optional[int] = None
+    conversation_path: Optional[str] = None
+
+    @model_serializer(mode="wrap")
+    def _drop_missing(self, handler):
+        # Only the fields that were set, like the plain dict this replaces
+        return {key: value for key, value in handler(self).items() if value is not None}
+
+# Metadata built by the code is typed; metadata the LLM forms is free-form,
+# and stays a plain dict when it doesn't fit the typed fields
+Metadata = Annotated[Union[MemoryMetadata, Dict[str, Any]], Field(union_mode="left_to_right")]
+
 class MemoryEntry(BaseModel):
     timestamp: str = Field(description="ISO format timestamp of when this memory was formed")
     memory_type: MemoryType = Field(description="Type of memory (episodic, semantic, etc.)")
@@ -56,18 +106,50 @@ class MemoryEntry(BaseModel):
     context: str = Field(description="The context in which this memory was formed")
     importance: int = Field(description="Importance score from 1-10", ge=1, le=10)
     conversation: Optional[Conversation] = Field(default=None, description="Associated conversation if memory_type is conversation")
-    metadata: Dict = Field(default_factory=dict, description="Additional metadata about the memory")
+    metadata: Metadata = Field(default_factory=MemoryMetadata, description="Additional metadata about the memory")
     embedding: Optional[MemoryEmbedding] = Field(default=None, description="Vector embedding for semantic search")
     references: List[str] = Field(default_factory=list, description="Timestamps of related memories")
     last_accessed: Optional[str] = Field(default=None, description="When this memory was last retrieved")
     access_count: int = Field(default=0, description="Number of times this memory has been accessed")
     consolidated: bool = Field(default=False, description="Whether this memory has been consolidated")
 
+    # Searchable text chunks, computed once by the memory system
+    _chunks: Optional[List[str]] = PrivateAttr(default=None)
+
+    def metadata_dict(self) -> Dict[str, Any]:
+        """Metadata as a plain dict, whether typed or as the LLM formed it"""
+        if isinstance(self.metadata, MemoryMetadata):
+            return self.metadata.model_dump(mode="json")
+        return self.metadata
+
+    @staticmethod
+    def load_conversation(path: Union[str, Path]) -> Conversation:
+        """Load a conversation streamed to a JSONL file, reading it through mmap"""
+        messages = []
+        with open(path, "rb") as f:
+            if Path(path).stat().st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for line in iter(data.readline, b""):
+                        if line.strip():
+                            messages.append(MESSAGE_ADAPTER.validate_json(line))
+        conversation = Conversation(messages=messages, summary=None)
+        conversation.roles.update(m.role for m in messages)
+        return conversation
+
 class Identity(BaseModel):
+    # Built once per MiDO, no need to build the validator at import
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
     name: str = Field(description="Name of the MiDO")
     goal: str = Field(description="Primary goal/purpose of the MiDO")
     personality: str = Field(description="Description of the MiDO's personality traits")
 
 class Reflection(BaseModel):
     state_update: State = Field(description="Updated state after reflection")
-    memory_formation: Optional[MemoryEntry] = Field(description="New memory to be formed, if any")
\ No newline at end of file
+    memory_formation: Optional[MemoryEntry] = Field(description="New memory to be formed, if any")
+
+# Serializers built once and reused for the models dumped on every save
+STATE_ADAPTER = TypeAdapter(State)
+MESSAGE_ADAPTER = TypeAdapter(Message)
+MEMORY_ADAPTER = TypeAdapter(MemoryEntry)
+METADATA_ADAPTER = TypeAdapter(Metadata)
@@ -0,0 +1,194 @@
+from typing import List, Dict, Optional, Tuple, Iterable
+import numpy as np
+
+def quantize_int8(vectors) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization.
+    Returns the int8 vectors and the float32 scale to multiply them by to get the originals back.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    max_abs = np.abs(vectors).max(axis=1)
+    scales = np.where(max_abs > 0, max_abs / 127, 1.0).astype(np.float32)
+    quantized = np.clip(np.round(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales
+
+def dequantize_int8(quantized, scales) -> np.ndarray:
+    """Float32 vectors back from int8 vectors and their scales"""
+    quantized = np.atleast_2d(np.asarray(quantized, dtype=np.int8))
+    return quantized.astype(np.float32) * np.atleast_1d(np.asarray(scales, dtype=np.float32))[:, None]
+
+# Number of set bits in each byte value, for Hamming distances between packed signatures
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first, without sorting all of them"""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates])]
+
+def grow_buffers(buffers: Dict[str, np.ndarray], size: int, used: int) -> Dict[str, np.ndarray]:
+    """
+    Preallocated buffers with room for size rows, keeping their first used rows.
+    Buffers at least double when they grow, so appending rows one at a time
+    costs amortized O(1); rows past those in use are unused.
+    """
+    capacity = len(next(iter(buffers.values())))
+    if size <= capacity:
+        return buffers
+    capacity = max(size, capacity * 2, 64)
+    grown = {}
+    for name, values in buffers.items():
+        buffer = np.empty((capacity,) + values.shape[1:], dtype=values.dtype)
+        buffer[:used] = values[:used]
+        grown[name] = buffer
+    return grown
+
+class QuantizedIndex:
+    """
+    In-memory int8 copy of the vector store for fast candidate generation.
+    Scanning int8 vectors moves a quarter of the bytes of float32 ones;
+    candidates are meant to be reranked with the full-precision vectors.
+    Optionally, past lsh_min_size entries, only the lsh_candidates entries whose
+    random-projection signatures are closest to the query's are scanned.
+    """
+    # Metadata fields kept as columns for filtering
+    FILTER_FIELDS = ("timestamp", "memory_type", "category")
+
+    def __init__(
+        self,
+        lsh_bits: int = 64,
+        lsh_candidates: int = 200,
+        lsh_min_size: Optional[int] = None,
+        seed: int = 0
+    ):
+        self.ids: List[str] = []
+        self.lsh_bits = lsh_bits
+        self.lsh_candidates = lsh_candidates
+        self.lsh_min_size = lsh_min_size
+        self.seed = seed
+        # Buffers grown by grow_buffers; rows past len(self) are unused
+        self._vectors: Optional[np.ndarray] = None
+        self._scales = np.empty(0, dtype=np.float32)
+        self._signatures = np.empty((0, lsh_bits // 8), dtype=np.uint8)
+        self._columns = {field: np.empty(0, dtype=object) for field in self.FILTER_FIELDS}
+        self._planes: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        return None if self._vectors is None else self._vectors[:len(self)]
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self._scales[:len(self)]
+
+    @property
+    def signatures(self) -> np.ndarray:
+        return self._signatures[:len(self)]
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {field: values[:len(self)] for field, values in self._columns.items()}
+
+    def _reserve(self, size: int, dim: int):
+        """Make room for size rows"""
+        if self._vectors is None:
+            self._vectors = np.empty((0, dim), dtype=np.int8)
+        buffers = grow_buffers(
+            {"vectors": self._vectors, "scales": self._scales, "signatures": self._signatures},
+            size,
+            len(self)
+        )
+        self._vectors, self._scales, self._signatures = buffers["vectors"], buffers["scales"], buffers["signatures"]
+        self._columns = grow_buffers(self._columns, size, len(self))
+
+    def _signature(self, vectors: np.ndarray) -> np.ndarray:
+        """Packed signs of the vectors' projections onto random hyperplanes"""
+        if self._planes is None:
+            rng = np.random.default_rng(self.seed)
+            self._planes = rng.standard_normal((self.lsh_bits, vectors.shape[1])).astype(np.float32)
+        return np.packbits(vectors @ self._planes.T > 0, axis=1)
+
+    def add(self, ids: List[str], embeddings, metadatas: List[Dict]):
+        """Add vectors with their metadata, replacing any existing entries with the same ids"""
+        if not len(ids):
+            return
+        self.remove(ids)
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        quantized, scales = quantize_int8(embeddings)
+        start, end = len(self), len(self) + len(ids)
+        self._reserve(end, quantized.shape[1])
+        self._vectors[start:end] = quantized
+        self._scales[start:end] = scales
+        self._signatures[start:end] = self._signature(embeddings)
+        for field in self.FILTER_FIELDS:
+            self._columns[field][start:end] = [m[field] for m in metadatas]
+        self.ids.extend(ids)
+
+    def remove(self, ids: Iterable[str]):
+        """Remove entries by id"""
+        ids = set(ids)
+        if not self.ids or not ids:
+            return
+        keep = np.fromiter((i not in ids for i in self.ids), dtype=bool, count=len(self.ids))
+        self._keep(keep)
+
+    def remove_where(self, field: str, values: Iterable[str]):
+        """Remove entries whose metadata field has one of the values"""
+        values = set(values)
+        if not self.ids or not values:
+            return
+        keep = np.fromiter((v not in values for v in self.columns[field]), dtype=bool, count=len(self.ids))
+        self._keep(keep)
+
+    def _keep(self, keep: np.ndarray):
+        """Keep only the rows selected by the mask"""
+        if keep.all():
+            return
+        size = int(keep.sum())
+        self._vectors[:size] = self.vectors[keep]
+        self._scales[:size] = self.scales[keep]
+        self._signatures[:size] = self.signatures[keep]
+        for field in self.FILTER_FIELDS:
+            self._columns[field][:size] = self._columns[field][:len(self)][keep]
+            self._columns[field][size:] = None
+        self.ids = [i for i, k in zip(self.ids, keep.tolist()) if k]
+
+    def _lsh_candidates(self, query: np.ndarray, rows: Optional[np.ndarray], count: int) -> np.ndarray:
+        """Rows whose signatures are closest to the query's in Hamming distance"""
+        signatures = self.signatures if rows is None else self.signatures[rows]
+        distances = _POPCOUNT[signatures ^ self._signature(query)].sum(axis=1, dtype=np.int32)
+        candidates = top_k(-distances, count)
+        return candidates if rows is None else rows[candidates]
+
+    def search(self, query, k: int, filter: Optional[Dict[str, str]] = None) -> List[str]:
+        """Ids of the k best candidates by approximate dot product, best first"""
+        if not self.ids:
+            return []
+        query = np.atleast_2d(np.asarray(query, dtype=np.float32))
+
+        # Rows to scan, None for all of them
+        rows = None
+        if filter:
+            mask = np.ones(len(self.ids), dtype=bool)
+            for field, value in filter.items():
+                mask &= self.columns[field] == value
+            rows = np.flatnonzero(mask)
+        if self.lsh_min_size is not None and len(self) >= self.lsh_min_size:
+            rows = self._lsh_candidates(query, rows, max(k, self.lsh_candidates))
+
+        vectors, scales = self.vectors, self.scales
+        if rows is not None:
+            vectors, scales = vectors[rows], scales[rows]
+        quantized_query, _ = quantize_int8(query)
+        # int8 products accumulated in int32; the query scale doesn't change the ranking
+        scores = np.einsum("ij,j->i", vectors, quantized_query[0], dtype=np.int32) * scales
+
+        top = top_k(scores, k)
+        if rows is not None:
+            top = rows[top]
+        return [self.ids[i] for i in top.tolist()]